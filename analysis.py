@@ -1,165 +1,372 @@
 # analysis.py
 import os
 import io
+import glob
+import hashlib
+import threading
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.signal import find_peaks
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
 
 # Matplotlib backend for headless servers
 import matplotlib
 matplotlib.use("Agg")
 
+# Values are read straight into float32 (no int64/float64 intermediate) and
+# stay float32 through the MA, slope and plotting passes, halving the bytes
+# each numeric pass has to move.
+CSV_DTYPES = {"Timestamp": str, "Values": np.float32}
+
 
 def load_df(csv_path=None, uploaded_bytes=None):
     """
     Load DataFrame either from a file path or uploaded BytesIO.
     """
     if uploaded_bytes is not None:
-        df = pd.read_csv(io.BytesIO(uploaded_bytes))
+        src = io.BytesIO(uploaded_bytes)
     elif csv_path is not None and os.path.exists(csv_path):
-        df = pd.read_csv(csv_path)
+        src = csv_path
     else:
         raise FileNotFoundError("CSV not found. Provide a valid path or upload a file.")
+    # Only read the two columns we use, with their types declared up front
+    df = pd.read_csv(src, usecols=lambda c: c in CSV_DTYPES, dtype=CSV_DTYPES)
     # Ensure expected columns
-    assert "Timestamp" in df.columns and "Values" in df.columns, \
-        "CSV must contain 'Timestamp' and 'Values' columns."
-    # Parse & sort
-    df["Timestamp"] = pd.to_datetime(df["Timestamp"], format="%d/%m/%y %H:%M", errors="coerce")
-    df = df.dropna(subset=["Timestamp"]).sort_values("Timestamp").reset_index(drop=True)
+    if not set(df.columns).issuperset(CSV_DTYPES):
+        raise ValueError("CSV must contain 'Timestamp' and 'Values' columns.")
+    # Parse & sort. Readings share minute-resolution stamps, so cache=True
+    # parses each distinct string once; exact=True keeps the strict format path.
+    df["Timestamp"] = pd.to_datetime(df["Timestamp"], format="%d/%m/%y %H:%M",
+                                     errors="coerce", exact=True, cache=True)
+    # Drop unparsed rows and sort in one gather instead of three frame copies
+    ts = df["Timestamp"].to_numpy()
+    keep = np.flatnonzero(~np.isnat(ts))
+    order = keep[np.argsort(ts[keep], kind="stable")]
+    df = df.take(order)
+    df.index = pd.RangeIndex(len(df))
     # 5 point moving average (your code uses 5 rows; not daily aggregation)
-    df["5_day_MA"] = df["Values"].rolling(window=5, min_periods=1).mean()
+    df["5_day_MA"] = trailing_mean(df["Values"].to_numpy(), 5)
     return df
 
 
-def find_extrema(df):
-    # peaks & troughs
-    peaks, _ = find_peaks(df["Values"])
-    troughs, _ = find_peaks(-df["Values"])
-    peaks_df = df.iloc[peaks].copy()
-    troughs_df = df.iloc[troughs].copy()
-    peaks_df = peaks_df[["Timestamp", "Values"]].rename(columns={"Values": "Value"})
-    troughs_df = troughs_df[["Timestamp", "Values"]].rename(columns={"Values": "Value"})
-    return peaks_df, troughs_df, peaks, troughs
-
-
-def below_20(df):
-    return df[df["Values"] < 20][["Timestamp", "Values"]].rename(columns={"Values": "Value"})
+def trailing_mean(vals, window):
+    """
+    Same as rolling(window, min_periods=1).mean(), via two convolutions:
+    the first len(vals) terms of a full convolution with ones are trailing sums.
+    """
+    if len(vals) == 0:
+        return vals.copy()
+    valid = ~np.isnan(vals)
+    kernel = np.ones(window, dtype=vals.dtype)
+    sums = np.convolve(np.where(valid, vals, 0), kernel)[:len(vals)]
+    counts = np.convolve(valid.astype(vals.dtype), kernel)[:len(vals)]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
 
 
-def find_downward_acceleration(df):
+def scan_values(vals):
     """
-    Your rule: find the point in each downward cycle where slope is the most negative.
+    Index arrays (peaks, troughs, below 20, downward acceleration) from one
+    shared first difference of vals, instead of a separate pass per detector.
     """
-    df = df.copy()
-    df["slope"] = df["Values"].diff()
+    n = len(vals)
+    if n == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, empty, empty
+    # Slope as a local array (same as Values.diff()); the frame is left untouched
+    slope = np.empty(n, dtype=np.result_type(vals.dtype, np.float32))
+    slope[0] = np.nan
+    np.subtract(vals[1:], vals[:-1], out=slope[1:])
+
+    # Peaks & troughs, matching scipy.signal.find_peaks with no extra
+    # conditions: runs of equal values are collapsed first so a flat extremum
+    # is reported at its middle sample, and runs touching either end never count.
+    bounds = np.flatnonzero(slope[1:] != 0) + 1
+    run_start = np.concatenate(([0], bounds))
+    run_end = np.concatenate((bounds, [n])) - 1
+    run_val = vals[run_start]
+    mid = (run_start[1:-1] + run_end[1:-1]) // 2
+    inner = run_val[1:-1]
+    peaks = mid[(inner > run_val[:-2]) & (inner > run_val[2:])]
+    troughs = mid[(inner < run_val[:-2]) & (inner < run_val[2:])]
+
+    below = np.flatnonzero(vals < 20)
+
+    # Your rule: find the point in each downward cycle where slope is the most
+    # negative. Downward cycles are runs of negative slope; pad with False so
+    # every run has both a start and an end edge.
+    neg = slope < 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], neg, [False])).view(np.int8)))
+    starts = edges[0::2]
+    if starts.size == 0:
+        return peaks, troughs, below, starts
+    # Each reduceat segment runs from one cycle start to the next, so the only
+    # negative slopes it holds are that cycle's: its min is the cycle's min
+    # (fmin, so a NaN gap after the cycle does not swallow it).
+    seg_min = np.fmin.reduceat(slope, starts)
+    seg_len = np.diff(np.append(starts, n))
+    hits = np.flatnonzero(slope[starts[0]:] == np.repeat(seg_min, seg_len)) + starts[0]
+    # First occurrence per cycle (matches idxmin on ties)
+    seg_of_hit = np.searchsorted(starts, hits, side="right") - 1
+    _, first = np.unique(seg_of_hit, return_index=True)
+    accel = hits[first]
+    return peaks, troughs, below, accel
 
-    downward_cycles = []
-    current_cycle = []
 
-    for i in range(1, len(df)):
-        if df["slope"].iloc[i] < 0:
-            current_cycle.append(i)
-        else:
-            if current_cycle:
-                downward_cycles.append(current_cycle)
-                current_cycle = []
-    if current_cycle:
-        downward_cycles.append(current_cycle)
+def _points(ts, vals, idx):
+    # Gather straight from the arrays rather than iloc + select + rename
+    return pd.DataFrame({"Timestamp": ts[idx], "Value": vals[idx]}, copy=False)
 
-    acceleration_points = []
-    for cycle in downward_cycles:
-        min_slope_idx = df["slope"].iloc[cycle].idxmin()
-        acceleration_points.append((
-            int(min_slope_idx),
-            df["Timestamp"].iloc[min_slope_idx],
-            float(df["Values"].iloc[min_slope_idx])
-        ))
 
-    accel_df = pd.DataFrame(acceleration_points, columns=["Index", "Timestamp", "Value"])
-    return accel_df
+def find_events(df):
+    ts = df["Timestamp"].to_numpy()
+    vals = df["Values"].to_numpy()
+    peaks, troughs, below, accel = scan_values(vals)
+    accel_df = _points(ts, vals, accel)
+    accel_df.insert(0, "Index", accel)
+    return {
+        "peaks_df": _points(ts, vals, peaks),
+        "troughs_df": _points(ts, vals, troughs),
+        "below_df": _points(ts, vals, below),
+        "accel_df": accel_df,
+        "peaks_idx": peaks,
+        "troughs_idx": troughs,
+        "below_idx": below,
+    }
 
 
 def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
 
+# Plots are shown scaled down in the dashboard grid, so a lower DPI and fast
+# zlib level cut encode time and payload without a visible difference.
+_PLOT_DPI = 90
+_PNG_KWARGS = {"optimize": False, "compress_level": 1}
+# Plot and acceleration CSV files are named <stem>.<data hash>.<ext> so they
+# can be served as immutable; this many generations per stem are kept on disk.
+_KEEP_PLOT_SETS = 8
+ACCEL_CSV_STEM = "downward_acceleration_points"
+
+
+def _write_if_changed(path, data):
+    """
+    Write data to path in one call, skipping the write if the file already holds it.
+    """
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return
+    except OSError:
+        pass
+    # Write beside the target and rename, so a reader never sees a partial file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def prune_oldest(paths, keep):
+    """
+    Remove all but the keep most recently touched of paths. Several workers
+    prune the same directories, so files removed meanwhile are skipped.
+    """
+    stamped = []
+    for path in paths:
+        try:
+            stamped.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    stamped.sort(reverse=True)
+    for _, path in stamped[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _prune_generations(out_dir, stem, ext):
+    prune_oldest(glob.glob(os.path.join(out_dir, glob.escape(stem) + ".*" + ext)),
+                 _KEEP_PLOT_SETS)
+
+
+def _touch_all(paths):
+    """
+    Mark paths as recently used; False if any is missing (never written, or
+    pruned by another worker).
+    """
+    try:
+        for path in paths:
+            os.utime(path)
+    except OSError:
+        return False
+    return True
+
+
+def _set_points(coll, x, y):
+    """
+    Point a pooled scatter at new data; hidden (and so left out of the legend) when empty.
+    """
+    coll.set_offsets(np.column_stack([mdates.date2num(x), y]) if len(x) else np.empty((0, 2)))
+    coll.set_visible(len(x) > 0)
+
+
+def _refresh_legend(ax):
+    # Only rebuild the legend when the set of visible artists changes
+    handles = [a for a in (*ax.lines, *ax.collections) if a.get_visible()]
+    key = tuple(id(h) for h in handles)
+    if _LEGEND_KEYS.get(id(ax)) != key:
+        ax.legend(handles=handles)
+        _LEGEND_KEYS[id(ax)] = key
+
+
+def _new_plot(title):
+    fig = Figure(figsize=(10, 4), dpi=_PLOT_DPI)
+    ax = fig.subplots()
+    line, = ax.plot(np.array([], dtype="datetime64[ns]"), [], label="Voltage")
+    ax.set_xlabel("Timestamp"); ax.set_ylabel("Voltage"); ax.set_title(title)
+    ax.grid(True)
+    return fig, ax, line
+
+
+# Figures are built once and re-pointed at new data on each request, which
+# skips the artist/tick/font setup that dominates small plots. Figure state is
+# shared, so rendering is serialised behind _PLOT_LOCK.
+_PLOT_LOCK = threading.Lock()
+_LEGEND_KEYS = {}
+_PLOT_BUF = io.BytesIO()
+_PLOTS = [
+    ("plot_1_original", *_new_plot("Original Voltage Data")),
+    ("plot_2_ma", *_new_plot("Voltage with 5-day Moving Average")),
+    ("plot_3_peaks_troughs", *_new_plot("Local Peaks & Troughs")),
+    ("plot_4_below20", *_new_plot("Voltage Below 20")),
+    ("plot_5_acceleration", *_new_plot("Downward Acceleration Points")),
+]
+_MA_LINE, = _PLOTS[1][2].plot(np.array([], dtype="datetime64[ns]"), [], label="5-day MA")
+_PEAKS_PTS = _PLOTS[2][2].scatter([], [], s=10, label="Peaks", zorder=5)
+_TROUGHS_PTS = _PLOTS[2][2].scatter([], [], s=10, label="Troughs", zorder=5)
+_BELOW_PTS = _PLOTS[3][2].scatter([], [], s=10, label="Voltage < 20", zorder=5)
+_ACCEL_PTS = _PLOTS[4][2].scatter([], [], s=15, label="Downward Acceleration", zorder=5)
+
+
+def warm_up():
+    """
+    Draw each pooled figure once so font loading, Agg setup and the date axis
+    machinery are initialised before the first PNG export. Opt-in: called
+    from gunicorn's on_starting hook, not on import.
+    """
+    now = np.datetime64("now", "m")
+    with _PLOT_LOCK:
+        for _, fig, ax, line in _PLOTS:
+            line.set_data(np.array([now, now + 1]), [0, 1])
+            _refresh_legend(ax)
+            fig.savefig(io.BytesIO(), format="png", bbox_inches="tight",
+                        dpi=_PLOT_DPI, pil_kwargs=_PNG_KWARGS)
+
+
+def _render_plots(df, peaks_idx, troughs_idx, accel_df, out_dir, paths):
+    ts = df["Timestamp"].to_numpy()
+    vals = df["Values"].to_numpy()
+    below = vals < 20
+
+    with _PLOT_LOCK:
+        # Plot 1-5 all share the voltage line
+        for _, _, _, line in _PLOTS:
+            line.set_data(ts, vals)
+        # Plot 2: 5-day MA
+        _MA_LINE.set_data(ts, df["5_day_MA"].to_numpy())
+        # Plot 3: Peaks & Troughs
+        _set_points(_PEAKS_PTS, ts[peaks_idx], vals[peaks_idx])
+        _set_points(_TROUGHS_PTS, ts[troughs_idx], vals[troughs_idx])
+        # Plot 4: Voltage < 20
+        _set_points(_BELOW_PTS, ts[below], vals[below])
+        # Plot 5: Downward acceleration points
+        _set_points(_ACCEL_PTS, accel_df["Timestamp"].to_numpy(), accel_df["Value"].to_numpy())
+
+        for (stem, fig, ax, _), path in zip(_PLOTS, paths):
+            ax.relim()
+            ax.autoscale_view()
+            _refresh_legend(ax)
+            _PLOT_BUF.seek(0)
+            _PLOT_BUF.truncate()
+            fig.savefig(_PLOT_BUF, format="png", bbox_inches="tight",
+                        dpi=_PLOT_DPI, pil_kwargs=_PNG_KWARGS)
+            with _PLOT_BUF.getbuffer() as data:
+                _write_if_changed(path, data)
+            _prune_generations(out_dir, stem, ".png")
+
+
+def data_digest(df):
+    """
+    Hash of the timestamps and values; everything plotted is derived from them.
+    """
+    digest = hashlib.blake2b(df["Timestamp"].to_numpy().tobytes(), digest_size=8)
+    digest.update(df["Values"].to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def plot_names(digest):
+    return [f"{stem}.{digest}.png" for stem, *_ in _PLOTS]
+
+
 def plot_and_save_all(df, peaks_idx, troughs_idx, accel_df, out_dir="static"):
+    """
+    Render the five plots and return their file names. Names carry a hash of
+    the data, so if a set for this data is already on disk it is reused as is.
+    """
     ensure_dir(out_dir)
+    digest = data_digest(df)
+    names = plot_names(digest)
+    paths = [os.path.join(out_dir, name) for name in names]
+    if _touch_all(paths):
+        return names
+    _render_plots(df, peaks_idx, troughs_idx, accel_df, out_dir, paths)
+    return names
 
-    # Plot 1: Original
-    fig = plt.figure(figsize=(10,4))
-    plt.plot(df["Timestamp"], df["Values"], label="Voltage")
-    plt.xlabel("Timestamp"); plt.ylabel("Voltage"); plt.title("Original Voltage Data")
-    plt.grid(True); plt.legend()
-    fig.savefig(os.path.join(out_dir, "plot_1_original.png"), bbox_inches="tight")
-    plt.close(fig)
-
-    # Plot 2: 5-day MA
-    fig = plt.figure(figsize=(10,4))
-    plt.plot(df["Timestamp"], df["Values"], label="Voltage")
-    plt.plot(df["Timestamp"], df["5_day_MA"], label="5-day MA")
-    plt.xlabel("Timestamp"); plt.ylabel("Voltage"); plt.title("Voltage with 5-day Moving Average")
-    plt.grid(True); plt.legend()
-    fig.savefig(os.path.join(out_dir, "plot_2_ma.png"), bbox_inches="tight")
-    plt.close(fig)
-
-    # Plot 3: Peaks & Troughs
-    fig = plt.figure(figsize=(10,4))
-    plt.plot(df["Timestamp"], df["Values"], label="Voltage")
-    if len(peaks_idx):
-        plt.scatter(df.iloc[peaks_idx]["Timestamp"], df.iloc[peaks_idx]["Values"],
-                    s=10, label="Peaks", zorder=5)
-    if len(troughs_idx):
-        plt.scatter(df.iloc[troughs_idx]["Timestamp"], df.iloc[troughs_idx]["Values"],
-                    s=10, label="Troughs", zorder=5)
-    plt.xlabel("Timestamp"); plt.ylabel("Voltage"); plt.title("Local Peaks & Troughs")
-    plt.grid(True); plt.legend()
-    fig.savefig(os.path.join(out_dir, "plot_3_peaks_troughs.png"), bbox_inches="tight")
-    plt.close(fig)
-
-    # Plot 4: Voltage < 20
-    below = df[df["Values"] < 20]
-    fig = plt.figure(figsize=(10,4))
-    plt.plot(df["Timestamp"], df["Values"], label="Voltage")
-    if not below.empty:
-        plt.scatter(below["Timestamp"], below["Values"], s=10, label="Voltage < 20", zorder=5)
-    plt.xlabel("Timestamp"); plt.ylabel("Voltage"); plt.title("Voltage Below 20")
-    plt.grid(True); plt.legend()
-    fig.savefig(os.path.join(out_dir, "plot_4_below20.png"), bbox_inches="tight")
-    plt.close(fig)
-
-    # Plot 5: Downward acceleration points
-    fig = plt.figure(figsize=(10,4))
-    plt.plot(df["Timestamp"], df["Values"], label="Voltage")
-    if not accel_df.empty:
-        plt.scatter(accel_df["Timestamp"], accel_df["Value"], s=15, label="Downward Acceleration", zorder=5)
-    plt.xlabel("Timestamp"); plt.ylabel("Voltage"); plt.title("Downward Acceleration Points")
-    plt.grid(True); plt.legend()
-    fig.savefig(os.path.join(out_dir, "plot_5_acceleration.png"), bbox_inches="tight")
-    plt.close(fig)
 
+def accel_csv_name(digest):
+    return f"{ACCEL_CSV_STEM}.{digest}.csv"
 
-def run_analysis(csv_path=None, uploaded_bytes=None, out_dir="static"):
-    df = load_df(csv_path=csv_path, uploaded_bytes=uploaded_bytes)
-    peaks_df, troughs_df, peaks_idx, troughs_idx = find_extrema(df)
-    below_df = below_20(df)
-    accel_df = find_downward_acceleration(df)
 
-    # Save acceleration CSV for download
+def save_accel_csv(accel_df, digest, out_dir="static"):
+    """
+    Save the acceleration points of the data hashed as digest and return the
+    file name. The name carries the hash, so an existing file is kept as is.
+    """
     ensure_dir(out_dir)
-    accel_csv_path = os.path.join(out_dir, "downward_acceleration_points.csv")
-    accel_df.to_csv(accel_csv_path, index=False)
+    name = accel_csv_name(digest)
+    path = os.path.join(out_dir, name)
+    if not _touch_all([path]):
+        _write_if_changed(path, accel_df.to_csv(index=False).encode())
+        _prune_generations(out_dir, ACCEL_CSV_STEM, ".csv")
+    return name
+
+
+def run_analysis(csv_path=None, uploaded_bytes=None, out_dir="static"):
+    """
+    Run the analysis and save the acceleration CSV. The Matplotlib PNGs are
+    left to plot_and_save_all (the dashboard draws its charts client-side
+    and only renders PNGs on export).
+    """
+    df = load_df(csv_path=csv_path, uploaded_bytes=uploaded_bytes)
+    events = find_events(df)
+    accel_df = events["accel_df"]
 
-    # Make all plots
-    plot_and_save_all(df, peaks_idx, troughs_idx, accel_df, out_dir=out_dir)
+    # Save acceleration CSV for download, named by the data it came from
+    digest = data_digest(df)
+    accel_csv_path = os.path.join(out_dir, save_accel_csv(accel_df, digest, out_dir))
 
     # Return tables (as DataFrames) to render
     return {
         "df": df,
-        "peaks_df": peaks_df,
-        "troughs_df": troughs_df,
-        "below_df": below_df,
+        "peaks_df": events["peaks_df"],
+        "troughs_df": events["troughs_df"],
+        "below_df": events["below_df"],
         "accel_df": accel_df,
+        "peaks_idx": events["peaks_idx"],
+        "troughs_idx": events["troughs_idx"],
+        "below_idx": events["below_idx"],
+        "digest": digest,
         "accel_csv_path": accel_csv_path
     }
\ No newline at end of file
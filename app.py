@@ -1,23 +1,112 @@
 # app.py
 import os
+import re
+import glob
+import hashlib
+import threading
+import numpy as np
 from flask import (
     Flask,
+    abort,
     render_template,
     request,
     send_from_directory,
     redirect,
     url_for,
 )
-from analysis import run_analysis
+from analysis import (
+    run_analysis,
+    load_df,
+    find_events,
+    data_digest,
+    plot_names,
+    plot_and_save_all,
+    accel_csv_name,
+    save_accel_csv,
+    prune_oldest,
+)
 
-app = Flask(__name__)
+# Flask's built-in static route would shadow static_files below
+app = Flask(__name__, static_folder=None)
+# Uploads are read into memory and kept on disk (see KEEP_EXPORTS); larger
+# requests get a 413 before anything is read
+app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024
 STATIC_DIR = "static"
 DATA_DIR = "data"
 DEFAULT_CSV = os.path.join(DATA_DIR, "Sample_Data.csv")
+# Plot and acceleration CSV files are named <stem>.<data hash>.<ext>, so
+# their contents never change
+HASHED_FILE = re.compile(r"^\w+\.[0-9a-f]{16}\.(?:png|csv)$")
+IMMUTABLE_MAX_AGE = 31536000
+# Uploaded CSVs are kept by data hash so the export links can re-render
+# exactly the data a page was built from, whichever worker serves them. With
+# the upload cap this bounds the directory to 512 MB.
+EXPORT_DIR = os.path.join(DATA_DIR, "exports")
+KEEP_EXPORTS = 32
+DIGEST = re.compile(r"^[0-9a-f]{16}$")
+
+# (key, context) of the last analysis in this worker. It is replaced with one
+# assignment and read once into a local, so concurrent threads never mix one
+# key with another's context. A context only links to files by its data
+# hash, so a hit never points at another analysis' output.
+_LAST = (None, None)
+
+
+def _cache_key(uploaded):
+    if uploaded:
+        return ("upload", hashlib.blake2b(uploaded, digest_size=16).hexdigest())
+    return (DEFAULT_CSV, os.path.getmtime(DEFAULT_CSV))
+
+
+def _shortest(x):
+    # Values are float32; go through their shortest repr so 19.3 widens to
+    # 19.3 rather than 19.299999237060547, without rounding digits away
+    return x.astype(str).astype(np.float64)
+
+
+def _rows(df):
+    # (Timestamp, Value) tuples for the template; avoids a dict per row
+    return list(zip(df["Timestamp"], _shortest(df["Value"].to_numpy()).tolist()))
+
+
+def _numbers(x):
+    # JSON-friendly floats: shortest repr of each float32, NaN sent as null
+    x = _shortest(x)
+    return np.where(np.isnan(x), None, x).tolist()
+
+
+def _series(results):
+    # Everything the browser needs to draw the five charts; overlays are
+    # sent as row indices into ts/v rather than as full-length columns
+    df = results["df"]
+    return {
+        "ts": df["Timestamp"].to_numpy().astype("datetime64[s]").astype(np.int64).tolist(),
+        "v": _numbers(df["Values"].to_numpy()),
+        "ma": _numbers(df["5_day_MA"].to_numpy()),
+        "peaks": results["peaks_idx"].tolist(),
+        "troughs": results["troughs_idx"].tolist(),
+        "below": results["below_idx"].tolist(),
+        "accel": results["accel_df"]["Index"].tolist(),
+    }
+
+
+def _keep_upload(digest, uploaded):
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"{digest}.csv")
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        # Write beside the target and rename, so a reader never sees a partial file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(uploaded)
+        os.replace(tmp, path)
+    prune_oldest(glob.glob(os.path.join(EXPORT_DIR, "*.csv")), KEEP_EXPORTS)
 
 
 @app.route("/", methods=["GET", "POST"])
 def index():
+    global _LAST
     uploaded = None
     if request.method == "POST":
         file = request.files.get("file")
@@ -25,39 +114,87 @@ def index():
             uploaded = file.read()
 
     try:
+        key = _cache_key(uploaded)
+        last_key, last_ctx = _LAST
+        if last_key == key:
+            if uploaded:
+                # Keep the stored copy fresh so its export links still resolve
+                _keep_upload(last_ctx["digest"], uploaded)
+            return render_template("index.html", **last_ctx)
+
         results = run_analysis(
             csv_path=None if uploaded else DEFAULT_CSV,
             uploaded_bytes=uploaded,
             out_dir=STATIC_DIR,
         )
+        digest = results["digest"]
+        if uploaded:
+            _keep_upload(digest, uploaded)
         context = {
-            "plots": [
-                "plot_1_original.png",
-                "plot_2_ma.png",
-                "plot_3_peaks_troughs.png",
-                "plot_4_below20.png",
-                "plot_5_acceleration.png",
-            ],
+            "digest": digest,
+            "series": _series(results),
             "tables": {
-                "peaks": results["peaks_df"].to_dict(orient="records"),
-                "troughs": results["troughs_df"].to_dict(orient="records"),
-                "below20": results["below_df"].to_dict(orient="records"),
-                "accel": results["accel_df"].to_dict(orient="records"),
+                "peaks": _rows(results["peaks_df"]),
+                "troughs": _rows(results["troughs_df"]),
+                "below20": _rows(results["below_df"]),
+                "accel": _rows(results["accel_df"]),
             },
-            "accel_csv": os.path.basename(results["accel_csv_path"]),
         }
+        _LAST = (key, context)
         return render_template("index.html", **context)
     except Exception as e:
         return render_template(
-            "index.html", error=str(e), plots=[], tables={}, accel_csv=None
+            "index.html", error=str(e), digest=None, series=None, tables={}
         )
 
 
+def _load_source(digest):
+    # The data a page with this hash was built from: its kept upload, or the
+    # default CSV if that still hashes the same
+    upload = os.path.join(EXPORT_DIR, f"{digest}.csv")
+    df = load_df(upload if os.path.exists(upload) else DEFAULT_CSV)
+    if data_digest(df) != digest:
+        abort(404)
+    return df
+
+
+@app.route("/export/<digest>/<int:n>.png")
+def export_plot(digest, n):
+    # Matplotlib PNG of chart n (1-5, as in the file stems) for the data hashed
+    # as digest, e.g. for reports
+    names = plot_names(digest)
+    if not DIGEST.match(digest) or not 1 <= n <= len(names):
+        abort(404)
+    name = names[n - 1]
+    if not os.path.exists(os.path.join(STATIC_DIR, name)):
+        df = _load_source(digest)
+        events = find_events(df)
+        plot_and_save_all(df, events["peaks_idx"], events["troughs_idx"], events["accel_df"],
+                          out_dir=STATIC_DIR)
+    return redirect(url_for("static_files", filename=name))
+
+
+@app.route("/export/<digest>/acceleration.csv")
+def export_accel_csv(digest):
+    # Acceleration points of the data hashed as digest; rebuilt if pruned
+    if not DIGEST.match(digest):
+        abort(404)
+    name = accel_csv_name(digest)
+    if not os.path.exists(os.path.join(STATIC_DIR, name)):
+        df = _load_source(digest)
+        save_accel_csv(find_events(df)["accel_df"], digest, out_dir=STATIC_DIR)
+    return redirect(url_for("static_files", filename=name))
+
+
 @app.route("/static/<path:filename>")
 def static_files(filename):
-    return send_from_directory(STATIC_DIR, filename)
+    if not HASHED_FILE.match(filename):
+        return send_from_directory(STATIC_DIR, filename)
+    resp = send_from_directory(STATIC_DIR, filename, max_age=IMMUTABLE_MAX_AGE)
+    resp.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return resp
 
 
 if __name__ == "__main__":
-    # For local testing
-    app.run(host="0.0.0.0", port=8000, debug=True)
\ No newline at end of file
+    # For local testing; deploy with gunicorn (see gunicorn.conf.py)
+    app.run(host="0.0.0.0", port=8000)
\ No newline at end of file
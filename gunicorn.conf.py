@@ -0,0 +1,17 @@
+# gunicorn.conf.py
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+worker_class = "gthread"
+threads = 2
+# Import app (and with it analysis' pooled figures) once in the master, so
+# workers share it copy-on-write instead of each paying the startup cost.
+preload_app = True
+
+
+def on_starting(server):
+    # Warm Matplotlib once in the master so forked workers don't pay for it
+    # on their first PNG export
+    import analysis
+    analysis.warm_up()
@@ -0,0 +1,293 @@
+// charts.js
+// Canvas line and point charts for the dashboard. Served by the app itself,
+// so the page loads no third-party script. Drag across a chart to zoom in on
+// that time range; double-click to zoom back out.
+(function () {
+  "use strict";
+
+  const PAD = { left: 60, right: 12, top: 28, bottom: 40 };
+  const FONT = "12px system-ui, -apple-system, Segoe UI, Roboto, sans-serif";
+  // Candidate x tick spacings, in seconds
+  const TIME_STEPS = [
+    60, 300, 900, 1800, 3600, 10800, 21600, 43200,
+    86400, 172800, 604800, 2592000, 7776000, 31536000,
+  ];
+
+  const pad2 = (n) => String(n).padStart(2, "0");
+  // Timestamps are wall-clock readings sent as UTC seconds; show them as-is
+  const fmtDate = (d) =>
+    `${d.getUTCFullYear()}-${pad2(d.getUTCMonth() + 1)}-${pad2(d.getUTCDate())}`;
+  const fmtTime = (d) => `${pad2(d.getUTCHours())}:${pad2(d.getUTCMinutes())}`;
+
+  function valueStep(span, count) {
+    const raw = span / count;
+    const mag = Math.pow(10, Math.floor(Math.log10(raw)));
+    const norm = raw / mag;
+    return (norm < 1.5 ? 1 : norm < 3 ? 2 : norm < 7 ? 5 : 10) * mag;
+  }
+
+  function timeStep(span, count) {
+    return TIME_STEPS.find((s) => span / s <= count) || TIME_STEPS[TIME_STEPS.length - 1];
+  }
+
+  // First index whose timestamp is >= t (or > t with after=true); ts is sorted
+  function bisect(ts, t, after) {
+    let lo = 0;
+    let hi = ts.length;
+    while (lo < hi) {
+      const mid = (lo + hi) >> 1;
+      if (ts[mid] < t || (after && ts[mid] === t)) lo = mid + 1;
+      else hi = mid;
+    }
+    return lo;
+  }
+
+  class Chart {
+    // series: [{label, color, values}] drawn as lines, or with idx (row
+    // indices into values) and size, drawn as points
+    constructor(root, opts) {
+      this.root = root;
+      this.title = opts.title;
+      this.yLabel = opts.yLabel || "";
+      this.ts = opts.ts;
+      this.series = opts.series;
+      this.height = opts.height || 300;
+      this.drag = null;
+
+      this.canvas = document.createElement("canvas");
+      this.canvas.style.display = "block";
+      this.ctx = this.canvas.getContext("2d");
+      this.legend = document.createElement("div");
+      this.legend.className = "chart-legend";
+      for (const s of this.series) {
+        const item = document.createElement("span");
+        const swatch = document.createElement("i");
+        swatch.style.background = s.color;
+        item.append(swatch, s.label);
+        this.legend.append(item);
+      }
+      this.readout = document.createElement("span");
+      this.readout.className = "muted";
+      this.legend.append(this.readout);
+      root.append(this.canvas, this.legend);
+
+      this.resetZoom();
+      this.bindEvents();
+      this.resize();
+    }
+
+    resetZoom() {
+      const ts = this.ts;
+      this.x0 = ts.length ? ts[0] : 0;
+      this.x1 = ts.length ? ts[ts.length - 1] : 0;
+      if (this.x1 <= this.x0) this.x1 = this.x0 + 60;
+    }
+
+    resize() {
+      const ratio = window.devicePixelRatio || 1;
+      this.width = this.root.clientWidth;
+      this.canvas.style.width = this.width + "px";
+      this.canvas.style.height = this.height + "px";
+      this.canvas.width = Math.round(this.width * ratio);
+      this.canvas.height = Math.round(this.height * ratio);
+      this.ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+      this.draw();
+    }
+
+    // y extent of everything drawn between rows lo and hi, padded by 5%
+    extent(lo, hi) {
+      let min = Infinity;
+      let max = -Infinity;
+      const take = (v) => {
+        if (v === null) return;
+        if (v < min) min = v;
+        if (v > max) max = v;
+      };
+      for (const s of this.series) {
+        if (s.idx) {
+          for (const i of s.idx) if (i >= lo && i < hi) take(s.values[i]);
+        } else {
+          for (let i = lo; i < hi; i++) take(s.values[i]);
+        }
+      }
+      if (min > max) return [0, 1];
+      if (min === max) return [min - 1, max + 1];
+      const pad = (max - min) * 0.05;
+      return [min - pad, max + pad];
+    }
+
+    timeAt(x) {
+      const { left, right } = this.box;
+      const f = Math.min(Math.max((x - left) / (right - left), 0), 1);
+      return this.x0 + f * (this.x1 - this.x0);
+    }
+
+    draw() {
+      const ctx = this.ctx;
+      const ts = this.ts;
+      const w = this.width;
+      const left = PAD.left;
+      const right = Math.max(w - PAD.right, left + 1);
+      const top = PAD.top;
+      const bottom = this.height - PAD.bottom;
+      this.box = { left, right };
+
+      const lo = bisect(ts, this.x0, false);
+      const hi = bisect(ts, this.x1, true);
+      const [y0, y1] = this.extent(lo, hi);
+      const sx = (t) => left + ((t - this.x0) / (this.x1 - this.x0)) * (right - left);
+      const sy = (v) => bottom - ((v - y0) / (y1 - y0)) * (bottom - top);
+
+      ctx.clearRect(0, 0, w, this.height);
+      ctx.font = "bold " + FONT;
+      ctx.fillStyle = "#222";
+      ctx.textAlign = "center";
+      ctx.textBaseline = "middle";
+      ctx.fillText(this.title, w / 2, 12);
+      ctx.font = FONT;
+      ctx.lineWidth = 1;
+
+      // Value grid and labels
+      ctx.strokeStyle = "#eee";
+      ctx.fillStyle = "#666";
+      ctx.textAlign = "right";
+      const vs = valueStep(y1 - y0, Math.max(2, Math.floor((bottom - top) / 40)));
+      const digits = Math.max(0, -Math.floor(Math.log10(vs)));
+      for (let v = Math.ceil(y0 / vs) * vs; v <= y1; v += vs) {
+        const y = Math.round(sy(v)) + 0.5;
+        ctx.beginPath();
+        ctx.moveTo(left, y);
+        ctx.lineTo(right, y);
+        ctx.stroke();
+        ctx.fillText(v.toFixed(digits), left - 6, y);
+      }
+      if (this.yLabel) {
+        ctx.save();
+        ctx.translate(10, (top + bottom) / 2);
+        ctx.rotate(-Math.PI / 2);
+        ctx.textAlign = "center";
+        ctx.fillText(this.yLabel, 0, 0);
+        ctx.restore();
+      }
+
+      // Time grid and labels; the date is repeated under the first tick and
+      // wherever the day changes
+      ctx.textAlign = "center";
+      const step = timeStep(this.x1 - this.x0, Math.max(2, Math.floor((right - left) / 90)));
+      let lastDate = "";
+      for (let t = Math.ceil(this.x0 / step) * step; t <= this.x1; t += step) {
+        const x = Math.round(sx(t)) + 0.5;
+        ctx.beginPath();
+        ctx.moveTo(x, top);
+        ctx.lineTo(x, bottom);
+        ctx.stroke();
+        const d = new Date(t * 1e3);
+        const date = fmtDate(d);
+        if (step >= 86400) {
+          ctx.fillText(date, x, bottom + 12);
+        } else {
+          ctx.fillText(fmtTime(d), x, bottom + 12);
+          if (date !== lastDate) ctx.fillText(date, x, bottom + 27);
+        }
+        lastDate = date;
+      }
+
+      ctx.save();
+      ctx.beginPath();
+      ctx.rect(left, top, right - left, bottom - top);
+      ctx.clip();
+      for (const s of this.series) {
+        ctx.strokeStyle = ctx.fillStyle = s.color;
+        if (s.idx) {
+          const r = (s.size || 5) / 2;
+          for (const i of s.idx) {
+            const v = s.values[i];
+            if (i < lo || i >= hi || v === null) continue;
+            ctx.beginPath();
+            ctx.arc(sx(ts[i]), sy(v), r, 0, 2 * Math.PI);
+            ctx.fill();
+          }
+        } else {
+          // One row either side so the line runs to the plot edges; nulls
+          // break it
+          ctx.beginPath();
+          let pen = false;
+          for (let i = Math.max(lo - 1, 0); i < Math.min(hi + 1, ts.length); i++) {
+            const v = s.values[i];
+            if (v === null) {
+              pen = false;
+              continue;
+            }
+            if (pen) ctx.lineTo(sx(ts[i]), sy(v));
+            else ctx.moveTo(sx(ts[i]), sy(v));
+            pen = true;
+          }
+          ctx.stroke();
+        }
+      }
+      if (this.drag) {
+        const [a, b] = this.drag;
+        ctx.fillStyle = "rgba(0, 0, 0, 0.08)";
+        ctx.fillRect(Math.min(a, b), top, Math.abs(b - a), bottom - top);
+      }
+      ctx.restore();
+      ctx.strokeStyle = "#ccc";
+      ctx.strokeRect(left + 0.5, top + 0.5, right - left, bottom - top);
+    }
+
+    // Time and line values of the row nearest the cursor
+    showReadout(x) {
+      const ts = this.ts;
+      if (!ts.length) return;
+      const t = this.timeAt(x);
+      let i = Math.min(bisect(ts, t, false), ts.length - 1);
+      if (i > 0 && t - ts[i - 1] < ts[i] - t) i -= 1;
+      const d = new Date(ts[i] * 1e3);
+      const parts = [`${fmtDate(d)} ${fmtTime(d)}`];
+      for (const s of this.series) {
+        if (!s.idx && s.values[i] !== null) parts.push(`${s.label}: ${s.values[i]}`);
+      }
+      this.readout.textContent = parts.join("  ");
+    }
+
+    bindEvents() {
+      const c = this.canvas;
+      const xAt = (e) => e.clientX - c.getBoundingClientRect().left;
+      c.addEventListener("mousedown", (e) => {
+        e.preventDefault();
+        this.drag = [xAt(e), xAt(e)];
+      });
+      c.addEventListener("mousemove", (e) => {
+        if (this.drag) {
+          this.drag[1] = xAt(e);
+          this.draw();
+        }
+        this.showReadout(xAt(e));
+      });
+      c.addEventListener("mouseleave", () => {
+        this.readout.textContent = "";
+      });
+      window.addEventListener("mouseup", () => {
+        if (!this.drag) return;
+        const [a, b] = this.drag;
+        this.drag = null;
+        if (Math.abs(b - a) > 4) {
+          const t0 = this.timeAt(Math.min(a, b));
+          const t1 = this.timeAt(Math.max(a, b));
+          if (t1 > t0) {
+            this.x0 = t0;
+            this.x1 = t1;
+          }
+        }
+        this.draw();
+      });
+      c.addEventListener("dblclick", () => {
+        this.resetZoom();
+        this.draw();
+      });
+      window.addEventListener("resize", () => this.resize());
+    }
+  }
+
+  window.drawChart = (root, opts) => new Chart(root, opts);
+})();